@@ -1,8 +1,15 @@
 from __future__ import absolute_import
 from __future__ import print_function
-import hashlib
+import binascii
 import os
 
+try:
+    from secrets import token_hex
+except ImportError:  # Python 2
+
+    def token_hex(nbytes):
+        return binascii.hexlify(os.urandom(nbytes)).decode("ascii")
+
 
 """
 - Update django secret key
@@ -14,7 +21,9 @@ import os
 
 
 def gen():
-    return hashlib.sha1(os.urandom(512)).hexdigest()
+    # 20 random bytes hex-encoded gives the same 40-character key shape as
+    # the old sha1-of-urandom approach, without the hash step.
+    return token_hex(20)
 
 
 myhash = gen()
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 import ast
 from collections import namedtuple
+import contextlib
 import datetime
 import hashlib
 import logging
@@ -602,6 +603,22 @@ def removedirs(relative_path, base=None):
         head, tail = os.path.split(head)
 
 
+@contextlib.contextmanager
+def closing_scandir(path):
+    """Yield ``scandir.scandir(path)``, closing the iterator when done.
+
+    The C iterator in the pinned ``scandir`` backport has no ``close()``
+    method (unlike ``os.scandir`` on Python 3.6+), so only close when the
+    iterator supports it; for the others the handle is released on
+    collection, as before.
+    """
+    entries = scandir.scandir(path)
+    try:
+        yield entries
+    finally:
+        getattr(entries, "close", lambda: None)()
+
+
 def coerce_str(string):
     """ Return string as a str, not a unicode, encoded in utf-8.
 
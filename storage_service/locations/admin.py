@@ -2,10 +2,21 @@ from __future__ import absolute_import
 from django.contrib import admin
 from .models import Event, Package, LocalFilesystem, Location, NFS, Pipeline, Space
 
-admin.site.register(Event)
-admin.site.register(Package)
-admin.site.register(LocalFilesystem)
-admin.site.register(Location)
-admin.site.register(NFS)
-admin.site.register(Pipeline)
-admin.site.register(Space)
+
+class EventAdmin(admin.ModelAdmin):
+    # Event rows render their package (whose string form walks the package's
+    # location and space for its full path), so join those tables in rather
+    # than querying them per row in the changelist.
+    list_select_related = ("package__current_location__space", "pipeline")
+    list_per_page = 50
+
+
+class PackageAdmin(admin.ModelAdmin):
+    # Package.__str__ builds full_path from current_location and its space.
+    list_select_related = ("current_location__space",)
+    list_per_page = 50
+
+
+admin.site.register(Event, EventAdmin)
+admin.site.register(Package, PackageAdmin)
+admin.site.register([LocalFilesystem, Location, NFS, Pipeline, Space])
@@ -1,7 +1,9 @@
 # stdlib, alphabetical
 from __future__ import absolute_import
-import cgi
+import concurrent.futures
+import copy
 import datetime
+from email.message import Message
 import logging
 import os
 import shutil
@@ -11,27 +13,64 @@ import time
 # Core Django, alphabetical
 from django.conf import settings
 from django.http import HttpResponse
-from django.template.loader import render_to_string
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 
 # External dependencies, alphabetical
+from lxml import etree
 import requests
 
 # This project, alphabetical
+from common import utils
 from locations import models
 from locations.models.async_manager import AsyncManager
 from common.utils import generate_checksum
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of concurrent downloads per batch download task. Downloads are pure
+# network I/O, so a small thread pool gives a large speedup over fetching the
+# files one at a time without overwhelming the remote server.
+DOWNLOAD_POOL_SIZE = 8
+
+# Shared session for batch downloads: keeps connections to the source server
+# alive across files instead of paying TCP/TLS setup per request. Sessions
+# are safe to share between the download pool's threads.
+REQUESTS_SESSION = requests.Session()
+
+# SWORD error document skeleton, parsed once at import time. Error responses
+# clone it and fill in the per-request text nodes, which is far cheaper than
+# running the Django template engine on the error path.
+ERROR_SKELETON = etree.fromstring(
+    b'<sword:error href="http://purl.org/net/sword/error/ErrorBadRequest"'
+    b' xmlns="http://www.w3.org/2005/Atom"'
+    b' xmlns:sword="http://purl.org/net/sword/">'
+    b'<summary type="text"/>'
+    b'<title type="text">ERROR</title>'
+    b"<updated/>"
+    b'<generator uri="" version="1.0">Archivematica</generator>'
+    b"<sword:userAgent/>"
+    b'<link rel="alternate" href="https://www.archivematica.org/wiki/Sword_API"'
+    b' type="text/html"/>'
+    b"</sword:error>"
+)
+ATOM_SUMMARY_TAG = utils.PREFIX_NS["atom"] + "summary"
+ATOM_UPDATED_TAG = utils.PREFIX_NS["atom"] + "updated"
+ATOM_GENERATOR_TAG = utils.PREFIX_NS["atom"] + "generator"
+SWORD_USER_AGENT_TAG = "{http://purl.org/net/sword/}userAgent"
+
 
 def get_deposit(uuid):
     """
     Shortcut to retrieve deposit data. Returns deposit model object or None
+
+    The deposit's location and space are joined in, since almost every
+    caller goes on to access deposit.full_path.
     """
     try:
-        return models.Package.objects.get(uuid=uuid)
+        return models.Package.objects.select_related("current_location__space").get(
+            uuid=uuid
+        )
     except models.Package.DoesNotExist:
         return None
 
@@ -54,25 +93,46 @@ def deposit_list(location_uuid):
 
 def write_request_body_to_temp_file(request):
     """
-    Write HTTP request's body content to a temp file.
+    Stream an HTTP request's body content to a temp file.
 
     Return the temp file's path
     """
     _, temp_filepath = tempfile.mkstemp()
-    with open(temp_filepath, "ab") as f:
-        f.write(request.body)
+    write_request_body_to_file(request, temp_filepath)
     return temp_filepath
 
 
+def write_request_body_to_file(request, file_path, checksum=None):
+    """
+    Stream an HTTP request's body content to `file_path` in chunks, without
+    buffering a second copy of the body in memory or on disk.
+
+    If `checksum` (a hashlib hash object) is provided it is updated with
+    each chunk, so the upload is hashed in the same pass that writes it.
+    """
+    with open(file_path, "wb") as f:
+        if checksum is None:
+            shutil.copyfileobj(request, f)
+            return
+        while True:
+            chunk = request.read(1024 * 1024)
+            if not chunk:
+                break
+            checksum.update(chunk)
+            f.write(chunk)
+
+
 def parse_filename_from_content_disposition(header):
     """
     Parse a filename from HTTP Content-Disposition data
 
     Return filename
     """
-    _, params = cgi.parse_header(header)
-    filename = params.get("filename", "")
-    return filename
+    # email's header parser handles quoting and RFC 2231/5987 encoded
+    # filenames, and is cheaper than cgi.parse_header's Python-level scan
+    message = Message()
+    message["Content-Disposition"] = header
+    return message.get_filename() or ""
 
 
 def pad_destination_filepath_if_it_already_exists(filepath, original=None, attempt=0):
@@ -103,14 +163,14 @@ def download_resource(
 
     Returns filename of downloaded resource
     """
-    LOGGER.info("downloading url: %s", url)
+    LOGGER.debug("downloading url: %s", url)
 
     auth = None
     if username is not None and password is not None:
         auth = (username, password)
 
     verify = not settings.INSECURE_SKIP_VERIFY
-    response = requests.get(url, auth=auth, verify=verify)
+    response = REQUESTS_SESSION.get(url, auth=auth, verify=verify)
     if filename is None:
         if "content-disposition" in response.headers:
             filename = parse_filename_from_content_disposition(
@@ -118,7 +178,7 @@ def download_resource(
             )
         else:
             filename = os.path.basename(url)
-    LOGGER.info("Filename set to " + filename)
+    LOGGER.debug("Filename set to %s", filename)
 
     filepath = os.path.join(destination_path, filename)
     with open(filepath, "wb") as fp:
@@ -178,77 +238,42 @@ def _fetch_content(deposit_uuid, objects, subdirs=None):
     fedora_username = getattr(deposit_space, "fedora_user", None)
     fedora_password = getattr(deposit_space, "fedora_password", None)
 
-    # download the files
-    temp_dir = tempfile.mkdtemp()
+    # download the files concurrently: the downloads are independent network
+    # I/O, so fan them out over a bounded thread pool instead of fetching one
+    # at a time.
+    # The temp dir lives inside the deposit so the final shutil.move is a
+    # same-filesystem rename instead of a second copy of every byte (mkdtemp
+    # defaults to /tmp, which is frequently a different filesystem).
+    temp_dir = tempfile.mkdtemp(dir=deposit.full_path)
     completed = 0
-    for item in objects:
-        # create download task file record
-        task_file = models.PackageDownloadTaskFile(task=task)
-        task_file.save()
-
-        try:
-            filename = item["filename"]
-
-            task_file.filename = filename
-            task_file.url = item["url"]
-            task_file.save()
-
-            download_resource(
-                url=item["url"],
-                destination_path=temp_dir,
-                filename=filename,
-                username=fedora_username,
-                password=fedora_password,
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=DOWNLOAD_POOL_SIZE
+    ) as executor:
+        futures = [
+            executor.submit(
+                _fetch_and_store_item,
+                task,
+                item,
+                deposit,
+                temp_dir,
+                subdirs,
+                fedora_username,
+                fedora_password,
             )
-
-            temp_filename = os.path.join(temp_dir, filename)
-
-            if (
-                item["checksum"] is not None
-                and item["checksum"]
-                != generate_checksum(temp_filename, "md5").hexdigest()
-            ):
-                os.unlink(temp_filename)
-                raise Exception(_("Incorrect checksum"))
-
-            # Some MODS records have no proper filenames
-            if filename == "MODS Record":
-                filename = item["object_id"].replace(":", "-") + "-MODS.xml"
-
-            if subdirs:
-                base_path = os.path.join(deposit.full_path, *subdirs)
-            else:
-                base_path = deposit.full_path
-
-            new_path = os.path.join(base_path, filename)
-            shutil.move(temp_filename, new_path)
-
-            # mark download task file record complete or failed
-            task_file.completed = True
-            task_file.save()
-
-            LOGGER.info("Saved file to " + new_path)
-            completed += 1
-
-            file_record = models.File(
-                name=item["filename"],
-                source_id=item["object_id"],
-                checksum=generate_checksum(new_path, "sha512").hexdigest(),
-            )
-            file_record.save()
-        except Exception as e:
-            LOGGER.exception("Package download task encountered an error:" + str(e))
-            # an error occurred
-            task_file.failed = True
-            task_file.save()
+            for item in objects
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            if future.result():
+                completed += 1
 
     # remove temp dir
     shutil.rmtree(temp_dir)
 
-    # record the number of successful downloads and completion time
-    task.downloads_completed = completed
-    task.download_completion_time = timezone.now()
-    task.save()
+    # record the number of successful downloads and completion time in a
+    # single UPDATE of just those two columns
+    models.PackageDownloadTask.objects.filter(pk=task.pk).update(
+        downloads_completed=completed, download_completion_time=timezone.now()
+    )
 
     # if the deposit is ready for finalization and this is the last batch
     # download to complete, then finalize
@@ -262,6 +287,78 @@ def _fetch_content(deposit_uuid, objects, subdirs=None):
         _finalize_if_not_empty(deposit_uuid)
 
 
+def _fetch_and_store_item(
+    task, item, deposit, temp_dir, subdirs, fedora_username, fedora_password
+):
+    """
+    Download a single batch download item, verify its checksum (if one was
+    provided) and move it into the deposit, recording progress in a
+    PackageDownloadTaskFile.
+
+    Runs in a worker thread of _fetch_content's download pool. Returns True
+    if the file was downloaded and stored successfully, False otherwise.
+    """
+    # create download task file record
+    task_file = models.PackageDownloadTaskFile(task=task)
+    task_file.save()
+
+    try:
+        filename = item["filename"]
+
+        task_file.filename = filename
+        task_file.url = item["url"]
+        task_file.save()
+
+        download_resource(
+            url=item["url"],
+            destination_path=temp_dir,
+            filename=filename,
+            username=fedora_username,
+            password=fedora_password,
+        )
+
+        temp_filename = os.path.join(temp_dir, filename)
+
+        if (
+            item["checksum"] is not None
+            and item["checksum"] != generate_checksum(temp_filename, "md5").hexdigest()
+        ):
+            os.unlink(temp_filename)
+            raise Exception(_("Incorrect checksum"))
+
+        # Some MODS records have no proper filenames
+        if filename == "MODS Record":
+            filename = item["object_id"].replace(":", "-") + "-MODS.xml"
+
+        if subdirs:
+            base_path = os.path.join(deposit.full_path, *subdirs)
+        else:
+            base_path = deposit.full_path
+
+        new_path = os.path.join(base_path, filename)
+        shutil.move(temp_filename, new_path)
+
+        # mark download task file record complete or failed
+        task_file.completed = True
+        task_file.save()
+
+        LOGGER.debug("Saved file to %s", new_path)
+
+        file_record = models.File(
+            name=item["filename"],
+            source_id=item["object_id"],
+            checksum=generate_checksum(new_path, "sha512").hexdigest(),
+        )
+        file_record.save()
+        return True
+    except Exception as e:
+        LOGGER.exception("Package download task encountered an error: %s", e)
+        # an error occurred
+        task_file.failed = True
+        task_file.save()
+        return False
+
+
 def spawn_finalization(deposit_uuid):
     """
     Spawn an asynchronous finalization
@@ -284,7 +381,11 @@ def _finalize_if_not_empty(deposit_uuid):
     result = {"error": True, "message": _("Deposit empty, or not done downloading.")}
     # don't finalize if still downloading
     if deposit_downloading_status(deposit) == models.PackageDownloadTask.COMPLETE:
-        if len(os.listdir(deposit.full_path)) > 0:
+        # any() stops at the first directory entry rather than listing them
+        # all; closing_scandir then releases the directory handle right away.
+        with utils.closing_scandir(deposit.full_path) as it:
+            has_files = any(it)
+        if has_files:
             # get sword server so we can access pipeline information
             if not deposit.current_location.pipeline.exists():
                 return {
@@ -396,12 +497,15 @@ def activate_transfer_and_request_approval_from_pipeline(deposit, pipeline):
 
 def sword_error_response(request, status, summary):
     """ Generate SWORD 2.0 error response """
-    error_details = {"summary": summary, "status": status}
-    error_details["request"] = request
-    error_details["update_time"] = datetime.datetime.now().__str__()
-    error_details["user_agent"] = request.META["HTTP_USER_AGENT"]
-    error_xml = render_to_string("locations/api/sword/error.xml", error_details)
-    return HttpResponse(error_xml, status=error_details["status"])
+    error = copy.deepcopy(ERROR_SKELETON)
+    error.find(ATOM_SUMMARY_TAG).text = summary
+    # isoformat() on a naive UTC timestamp is cheaper than the tz-aware
+    # timezone.now() and the default datetime __str__ formatting
+    error.find(ATOM_UPDATED_TAG).text = datetime.datetime.utcnow().isoformat()
+    error.find(ATOM_GENERATOR_TAG).set("uri", request.get_full_path())
+    error.find(SWORD_USER_AGENT_TAG).text = request.META.get("HTTP_USER_AGENT", "")
+    error_xml = etree.tostring(error, encoding="UTF-8", xml_declaration=True)
+    return HttpResponse(error_xml, status=status)
 
 
 def store_mets_data(mets_path, deposit, object_id):
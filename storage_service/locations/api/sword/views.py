@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 
 # stdlib, alphabetical
+import hashlib
+import hmac
+import json
 import logging
 from lxml import etree as etree
 import os
@@ -9,14 +12,12 @@ import traceback
 
 # Core Django, alphabetical
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import get_template
 from django.utils import timezone
 from django.utils.translation import ugettext as _
 from django.utils import six
 
-# External dependencies, alphabetical
-
 # This project, alphabetical
 from . import helpers
 from common import utils
@@ -24,6 +25,26 @@ from locations import models
 
 LOGGER = logging.getLogger(__name__)
 
+# Qualified METS/xlink names used when parsing deposit METS files, computed
+# once instead of per element.
+METS_METS_TAG = utils.PREFIX_NS["mets"] + "mets"
+METS_FILEGRP_TAG = utils.PREFIX_NS["mets"] + "fileGrp"
+METS_FLOCAT_TAG = utils.PREFIX_NS["mets"] + "FLocat"
+XLINK_HREF_ATTR = utils.PREFIX_NS["xlink"] + "href"
+XLINK_TITLE_ATTR = utils.PREFIX_NS["xlink"] + "title"
+
+# The only tags the METS iterparse pass subscribes to.
+METS_PARSE_TAGS = (METS_METS_TAG, METS_FILEGRP_TAG, METS_FLOCAT_TAG)
+
+# Response templates, compiled once at import time. Renders below pass an
+# explicit minimal context rather than locals().
+SERVICE_DOCUMENT_TEMPLATE = get_template("locations/api/sword/service_document.xml")
+FEED_HEAD_TEMPLATE = get_template("locations/api/sword/_feed_head.xml")
+FEED_ENTRY_TEMPLATE = get_template("locations/api/sword/_entry.xml")
+ENTRY_TEMPLATE = get_template("locations/api/sword/entry.xml")
+STATE_TEMPLATE = get_template("locations/api/sword/state.xml")
+DEPOSIT_RECEIPT_TEMPLATE = get_template("locations/api/sword/deposit_receipt.xml")
+
 
 def service_document(request):
     """
@@ -56,8 +77,8 @@ def service_document(request):
 
         collections.append({"title": title, "url": col_iri})
 
-    service_document_xml = render_to_string(
-        "locations/api/sword/service_document.xml", locals()
+    service_document_xml = SERVICE_DOCUMENT_TEMPLATE.render(
+        {"collections": collections}
     )
     response = HttpResponse(service_document_xml)
     response["Content-Type"] = "application/atomserv+xml"
@@ -104,31 +125,38 @@ def collection(request, location):
         )
         feed = {"title": "Deposits", "url": col_iri}
 
-        entries = []
-        for deposit in helpers.deposit_list(location.uuid):
-            edit_iri = request.build_absolute_uri(
-                reverse(
-                    "sword_deposit",
-                    kwargs={
-                        "api_name": "v1",
-                        "resource_name": "file",
-                        "uuid": deposit.uuid,
-                    },
+        # The feed only needs each deposit's uuid and description, so fetch
+        # just those two columns in a single query.
+        deposits = helpers.deposit_list(location.uuid).values("uuid", "description")
+
+        def stream_feed():
+            """Yield the feed one entry at a time so large collections are
+            sent to the client incrementally instead of being rendered into
+            one in-memory string."""
+            yield FEED_HEAD_TEMPLATE.render({"feed": feed})
+            for deposit in deposits.iterator():
+                edit_iri = request.build_absolute_uri(
+                    reverse(
+                        "sword_deposit",
+                        kwargs={
+                            "api_name": "v1",
+                            "resource_name": "file",
+                            "uuid": deposit["uuid"],
+                        },
+                    )
                 )
-            )
-
-            entries.append(
-                {
-                    "title": deposit.description or "Deposit " + deposit.uuid,
-                    "url": edit_iri,
-                }
-            )
+                yield FEED_ENTRY_TEMPLATE.render(
+                    {
+                        "entry": {
+                            "title": deposit["description"]
+                            or "Deposit " + deposit["uuid"],
+                            "url": edit_iri,
+                        }
+                    }
+                )
+            yield "</atom:feed>\n"
 
-        # feed and entries passed via locals() to the template
-        collection_xml = render_to_string(
-            "locations/api/sword/collection.xml", locals()
-        )
-        response = HttpResponse(collection_xml)
+        response = StreamingHttpResponse(stream_feed())
         response["Content-Type"] = "application/atom+xml;type=feed"
         return response
 
@@ -324,57 +352,88 @@ def _parse_name_and_content_urls_from_mets_file(filepath):
     """
     Parse deposit name and control URLS from a METS XML file
 
+    The file is parsed in a single streaming pass with etree.iterparse so
+    that large METS documents never have to be held in memory in full: only
+    the mets root attributes and the FLocat elements inside the DATASTREAMS
+    OBJ/MODS file groups are examined, and processed elements are cleared as
+    soon as they have been read.
+
     Returns a dict with the keys 'deposit_name' and 'objects'
     """
-    tree = etree.parse(filepath)
-    root = tree.getroot()
-    deposit_name = root.get("LABEL")
-    object_id = root.get("OBJID")
-    deposit_name = deposit_name.replace("/", "\\")
-    LOGGER.info("found deposit name in mets: %s", deposit_name)
+    deposit_name = None
+    object_id = None
 
     # parse XML for content URLs
     objects = []
     mods = []
 
-    for type_ in ("OBJ", "MODS"):
+    # Track the IDs of the currently open fileGrp elements so FLocat
+    # elements can be attributed to the DATASTREAMS OBJ or MODS group
+    # without an XPath pass over a full tree.
+    filegrp_stack = []
+
+    # collect_ids=False skips building libxml2's XML ID hash (never queried
+    # here); no_network/huge_tree are pinned to their safe values explicitly.
+    context = etree.iterparse(
+        filepath,
+        events=("start", "end"),
+        tag=METS_PARSE_TAGS,
+        no_network=True,
+        huge_tree=False,
+        collect_ids=False,
+    )
+    for event, element in context:
+        if event == "start":
+            if element.tag == METS_FILEGRP_TAG:
+                filegrp_stack.append(element.get("ID"))
+            elif element.tag == METS_METS_TAG:
+                deposit_name = element.get("LABEL")
+                object_id = element.get("OBJID")
+                if deposit_name is not None:
+                    deposit_name = deposit_name.replace("/", "\\")
+                LOGGER.info("found deposit name in mets: %s", deposit_name)
+            continue
+
+        if element.tag == METS_FILEGRP_TAG:
+            filegrp_stack.pop()
+        elif element.tag == METS_FLOCAT_TAG:
+            if (
+                len(filegrp_stack) >= 2
+                and filegrp_stack[-2] == "DATASTREAMS"
+                and filegrp_stack[-1] in ("OBJ", "MODS")
+            ):
+                collection = objects if filegrp_stack[-1] == "OBJ" else mods
+
+                url = element.get(XLINK_HREF_ATTR)
+                filename = element.get(XLINK_TITLE_ATTR)
+                filename = filename.replace("/", "\\")
 
-        if type_ == "OBJ":
-            collection = objects
-        elif type_ == "MODS":
-            collection = mods
+                # only MD5 checksums currently supported
+                checksumtype = element.get("CHECKSUMTYPE")
+                checksum = element.get("CHECKSUM")
 
-        elements = root.iterfind(
-            "mets:fileSec/mets:fileGrp[@ID='DATASTREAMS']/mets:fileGrp[@ID='"
-            + type_
-            + "']/mets:file/mets:FLocat",
-            namespaces=utils.NSMAP,
-        )
-        for element in elements:
-            url = element.get("{http://www.w3.org/1999/xlink}href")
-            filename = element.get("{http://www.w3.org/1999/xlink}title")
-            filename = filename.replace("/", "\\")
-
-            # only MD5 checksums currently supported
-            checksumtype = element.get("CHECKSUMTYPE")
-            checksum = element.get("CHECKSUM")
-
-            if checksum is not None and checksumtype != "MD5":
-                raise Exception(
-                    _(
-                        "If using CHECKSUM attribute, CHECKSUMTYPE attribute value must be set to MD5 in XML"
+                if checksum is not None and checksumtype != "MD5":
+                    raise Exception(
+                        _(
+                            "If using CHECKSUM attribute, CHECKSUMTYPE attribute value must be set to MD5 in XML"
+                        )
                     )
+
+                collection.append(
+                    {
+                        "object_id": object_id,
+                        "filename": filename,
+                        "url": url,
+                        "checksum": checksum,
+                    }
                 )
+                LOGGER.debug("found url in mets: %s", url)
 
-            collection.append(
-                {
-                    "object_id": object_id,
-                    "filename": filename,
-                    "url": url,
-                    "checksum": checksum,
-                }
-            )
-            LOGGER.info("found url in mets: %s", url)
+            # Free the subtree that has just been read so memory use stays
+            # constant regardless of document size.
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
 
     return {
         "deposit_name": deposit_name,
@@ -401,27 +460,32 @@ def _create_deposit_directory_and_db_entry(
     # Pad deposit path, if it already exists, and either copy source data to it or just create it
     deposit_path = helpers.pad_destination_filepath_if_it_already_exists(deposit_path)
 
-    if source_path:
-        shutil.copytree(source_path, deposit_path)
-    else:
-        os.mkdir(deposit_path)
-        os.chmod(deposit_path, 0o2770)  # drwxrws---
+    # mkdir and copytree raise on failure, so no stat() of the new path is
+    # needed to confirm it exists. The chmod stays separate from mkdir since
+    # mkdir's mode argument is masked by the umask.
+    try:
+        if source_path:
+            shutil.copytree(source_path, deposit_path)
+        else:
+            os.mkdir(deposit_path)
+            os.chmod(deposit_path, 0o2770)  # drwxrws---
+    except (os.error, shutil.Error):
+        LOGGER.warning("Could not create deposit directory %s", deposit_path)
+        return None
 
     # Create SWORD deposit location using deposit name and path
-    if os.path.exists(deposit_path):
-        deposit = models.Package.objects.create(
-            description=deposit_name,
-            current_location=location,
-            current_path=os.path.basename(deposit_path),
-            package_type=models.Package.DEPOSIT,
-            status=models.Package.PENDING,
-        )
-        # TODO: implement this
-        if sourceofacquisition:
-            deposit.misc_attributes.update({"sourceofacquisition": sourceofacquisition})
-        deposit.save()
-        return deposit
-    return None
+    deposit = models.Package.objects.create(
+        description=deposit_name,
+        current_location=location,
+        current_path=os.path.basename(deposit_path),
+        package_type=models.Package.DEPOSIT,
+        status=models.Package.PENDING,
+    )
+    # TODO: implement this
+    if sourceofacquisition:
+        deposit.misc_attributes.update({"sourceofacquisition": sourceofacquisition})
+    deposit.save()
+    return deposit
 
 
 def deposit_edit(request, deposit):
@@ -438,13 +502,13 @@ def deposit_edit(request, deposit):
       curl -v -XDELETE http://127.0.0.1:8000/api/v1/file/149cc29d-6472-4bcf-bee8-f8223bf60580/sword/
     """
     if isinstance(deposit, six.string_types):
-        try:
-            deposit = models.Package.objects.get(uuid=deposit)
-        except models.Package.DoesNotExist:
+        uuid = deposit
+        deposit = helpers.get_deposit(uuid)
+        if deposit is None:
             return helpers.sword_error_response(
                 request,
                 404,
-                _("Deposit location %(uuid)s does not exist.") % {"uuid": deposit},
+                _("Deposit location %(uuid)s does not exist.") % {"uuid": uuid},
             )
 
     if deposit.has_been_submitted_for_processing():
@@ -464,9 +528,7 @@ def deposit_edit(request, deposit):
             )
         )
         entry = {"title": deposit.description, "url": edit_iri}
-        response = HttpResponse(
-            render_to_string("locations/api/sword/entry.xml", locals())
-        )
+        response = HttpResponse(ENTRY_TEMPLATE.render({"entry": entry}))
         response["Content-Type"] = "application/atom+xml"
         return response
     elif request.method == "POST":
@@ -581,13 +643,13 @@ def deposit_media(request, deposit):
     """
 
     if isinstance(deposit, six.string_types):
-        try:
-            deposit = models.Package.objects.get(uuid=deposit)
-        except models.Package.DoesNotExist:
+        uuid = deposit
+        deposit = helpers.get_deposit(uuid)
+        if deposit is None:
             return helpers.sword_error_response(
                 request,
                 404,
-                _("Deposit location %(uuid)s does not exist.") % {"uuid": deposit},
+                _("Deposit location %(uuid)s does not exist.") % {"uuid": uuid},
             )
 
     if deposit.has_been_submitted_for_processing():
@@ -597,7 +659,21 @@ def deposit_media(request, deposit):
 
     if request.method == "GET":
         # TODO should this be returned in SWORD XML?
-        return HttpResponse(str(os.listdir(deposit.full_path)))
+        def stream_file_list():
+            """Yield the deposit's files as a JSON array, one lazily-scanned
+            entry at a time."""
+            yield "["
+            first = True
+            with utils.closing_scandir(deposit.full_path) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        yield ("" if first else ",") + json.dumps(entry.name)
+                        first = False
+            yield "]"
+
+        return StreamingHttpResponse(
+            stream_file_list(), content_type="application/json"
+        )
     elif request.method == "PUT":
         # replace a file in the deposit
         return _handle_adding_to_or_replacing_file_in_deposit(
@@ -669,13 +745,14 @@ def deposit_media(request, deposit):
                 task__package=deposit
             ).delete()
             models.PackageDownloadTask.objects.filter(package=deposit).delete()
-            # Delete all files
-            for filename in os.listdir(deposit.full_path):
-                filepath = os.path.join(deposit.full_path, filename)
-                if os.path.isfile(filepath):
-                    os.remove(filepath)
-                elif os.path.isdir(filepath):
-                    shutil.rmtree(filepath)
+            # Delete all files. scandir carries each entry's type, saving the
+            # two stat() calls per entry that listdir + isfile/isdir cost.
+            with utils.closing_scandir(deposit.full_path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.remove(entry.path)
 
             return HttpResponse(status=204)  # No content
     else:
@@ -696,13 +773,13 @@ def deposit_state(request, deposit):
       curl -v http://localhost:8000/api/v1/location/96606387-cc70-4b09-b422-a7220606488d/sword/state/
     """
     if isinstance(deposit, six.string_types):
-        try:
-            deposit = models.Package.objects.get(uuid=deposit)
-        except models.Package.DoesNotExist:
+        uuid = deposit
+        deposit = helpers.get_deposit(uuid)
+        if deposit is None:
             return helpers.sword_error_response(
                 request,
                 404,
-                _("Deposit location %(uuid)s does not exist.") % {"uuid": deposit},
+                _("Deposit location %(uuid)s does not exist.") % {"uuid": uuid},
             )
 
     if request.method == "GET":
@@ -737,7 +814,13 @@ def deposit_state(request, deposit):
                 )
 
         response = HttpResponse(
-            render_to_string("locations/api/sword/state.xml", locals())
+            STATE_TEMPLATE.render(
+                {
+                    "state_term": state_term,
+                    "state_description": state_description,
+                    "entries": entries,
+                }
+            )
         )
         response["Content-Type"] = "application/atom+xml;type=feed"
         return response
@@ -805,11 +888,18 @@ def _handle_upload_request_with_potential_md5_checksum(
     Returns a response (with a specified HTTP status code) or an error response
     if a checksum has been provided but the destination file's is different
     """
-    temp_filepath = helpers.write_request_body_to_temp_file(request)
+    # Stream the body straight to its destination instead of spooling it to
+    # a temp file and copying it over afterwards. When a Content-MD5 header
+    # is present the checksum is computed from the in-flight stream, saving
+    # a second full read of the file.
     if "HTTP_CONTENT_MD5" in request.META:
-        md5sum = helpers.get_file_md5_checksum(temp_filepath)
-        if request.META["HTTP_CONTENT_MD5"] != md5sum:
-            os.remove(temp_filepath)
+        checksum = hashlib.md5()
+        helpers.write_request_body_to_file(request, file_path, checksum=checksum)
+        md5sum = checksum.hexdigest()
+        if not hmac.compare_digest(
+            str(request.META["HTTP_CONTENT_MD5"]), str(md5sum)
+        ):
+            os.remove(file_path)
             return helpers.sword_error_response(
                 request,
                 400,
@@ -821,14 +911,9 @@ def _handle_upload_request_with_potential_md5_checksum(
                     "header_md5sum": request.META["HTTP_CONTENT_MD5"],
                 },
             )
-        else:
-            shutil.copyfile(temp_filepath, file_path)
-            os.remove(temp_filepath)
-            return HttpResponse(status=success_status_code)
     else:
-        shutil.copyfile(temp_filepath, file_path)
-        os.remove(temp_filepath)
-        return HttpResponse(status=success_status_code)
+        helpers.write_request_body_to_file(request, file_path)
+    return HttpResponse(status=success_status_code)
 
 
 def _deposit_receipt_response(request, deposit, status_code):
@@ -837,7 +922,7 @@ def _deposit_receipt_response(request, deposit, status_code):
     """
     # Deposit needed for deposit receipt template
     if isinstance(deposit, six.string_types):
-        deposit = models.Package.objects.get(uuid=deposit)
+        deposit = helpers.get_deposit(deposit)
     # TODO: fix minor issues with template
     media_iri = request.build_absolute_uri(
         reverse(
@@ -862,7 +947,15 @@ def _deposit_receipt_response(request, deposit, status_code):
         kwargs={"api_name": "v1", "resource_name": "file", "uuid": deposit.uuid},
     )
     current_datetime = timezone.now()
-    receipt_xml = render_to_string("locations/api/sword/deposit_receipt.xml", locals())
+    receipt_xml = DEPOSIT_RECEIPT_TEMPLATE.render(
+        {
+            "deposit": deposit,
+            "media_iri": media_iri,
+            "edit_iri": edit_iri,
+            "state_iri": state_iri,
+            "current_datetime": current_datetime,
+        }
+    )
 
     response = HttpResponse(receipt_xml, content_type="text/xml", status=status_code)
     response["Location"] = location
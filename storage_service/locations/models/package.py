@@ -1969,18 +1969,32 @@ class Package(models.Model):
                 response["failures"]["files"]["untracked"].append(info)
         report = json.dumps(response)
 
-        # Trigger the signals (so ``FixityLog`` instances are created)
+        # Trigger the signals (so ``FixityLog`` instances are created). The
+        # parsed dict is passed alongside the JSON so receivers don't have to
+        # decode the report again.
         if success is False:
             signals.failed_fixity_check.send(
-                sender=self, uuid=self.uuid, location=self.full_path, report=report
+                sender=self,
+                uuid=self.uuid,
+                location=self.full_path,
+                report=response,
+                report_json=report,
             )
         elif success is None:
             signals.fixity_check_not_run.send(
-                sender=self, uuid=self.uuid, location=self.full_path, report=report
+                sender=self,
+                uuid=self.uuid,
+                location=self.full_path,
+                report=response,
+                report_json=report,
             )
         elif success is True:
             signals.successful_fixity_check.send(
-                sender=self, uuid=self.uuid, location=self.full_path, report=report
+                sender=self,
+                uuid=self.uuid,
+                location=self.full_path,
+                report=response,
+                report_json=report,
             )
         return report, response
 
@@ -17,7 +17,6 @@ from django.utils.translation import ugettext_lazy as _
 from django.utils import six
 
 # Third party dependencies, alphabetical
-import scandir
 from django_extensions.db.fields import UUIDField
 
 # This project, alphabetical
@@ -649,40 +648,36 @@ class Space(models.Model):
         :param user: Username on remote host
         :param host: Hostname of remote host
         """
-        # Assemble a set of directories to create on the remote server;
-        # these will be created one at a time
-        directories = []
-        path = destination_path
-        while path != "" and path != "/":
-            directories.insert(0, path)
-            path = os.path.dirname(path)
-
-        # Syncing an empty directory will ensure no files get transferred
-        temp_dir = os.path.join(tempfile.mkdtemp(), "")
-
-        # Creates the destination_path directory without copying any files
-        # Dir must end in a / for rsync to create it
-        for directory in directories:
-            path = os.path.join(os.path.dirname(directory), "")
-            path = "{}@{}:{}".format(user, host, utils.coerce_str(path))
-            cmd = [
-                "rsync",
-                "-vv",
-                "--protect-args",
-                "--chmod=ug=rwx,o=rx",
-                "--recursive",
-                temp_dir,
-                path,
-            ]
-            LOGGER.info("rsync path creation command: %s", cmd)
-            try:
-                subprocess.check_call(cmd)
-            except subprocess.CalledProcessError as e:
-                shutil.rmtree(temp_dir)
-                LOGGER.warning("rsync path creation failed: %s", e)
-                raise
+        relative_dir = os.path.dirname(destination_path).lstrip("/")
+        if not relative_dir:
+            return
 
-        shutil.rmtree(temp_dir)
+        # Recreate the directory chain locally inside a temp dir and sync it
+        # to the root of the remote host with a single rsync call, instead of
+        # one rsync invocation (and SSH round trip) per path component.
+        # Syncing only empty directories ensures no files get transferred, and
+        # rsync leaves the permissions of directories that already exist alone.
+        temp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(temp_dir, relative_dir))
+
+        path = "{}@{}:{}".format(user, host, utils.coerce_str("/"))
+        cmd = [
+            "rsync",
+            "-vv",
+            "--protect-args",
+            "--chmod=ug=rwx,o=rx",
+            "--recursive",
+            os.path.join(temp_dir, ""),
+            path,
+        ]
+        LOGGER.info("rsync path creation command: %s", cmd)
+        try:
+            subprocess.check_call(cmd)
+        except subprocess.CalledProcessError as e:
+            LOGGER.warning("rsync path creation failed: %s", e)
+            raise
+        finally:
+            shutil.rmtree(temp_dir)
 
     def browse_local(self, path):
         """
@@ -734,7 +729,8 @@ class Space(models.Model):
         command += [path]
 
         LOGGER.info("rsync list command: %s", command)
-        LOGGER.debug('"%s"', '" "'.join(command))  # For copying to shell
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('"%s"', '" "'.join(command))  # For copying to shell
         try:
             env = os.environ.copy()
             if assume_rsync_daemon:
@@ -776,8 +772,8 @@ class Space(models.Model):
                 if name not in directories:
                     properties[name]["size"] = int(e.group("size").replace(",", ""))
 
-        directories = sorted(directories, key=lambda s: s.lower())
-        entries = sorted(entries, key=lambda s: s.lower())
+        directories = sorted(directories, key=str.lower)
+        entries = sorted(entries, key=str.lower)
         LOGGER.debug("entries: %s", entries)
         LOGGER.debug("directories: %s", directories)
         return {"directories": directories, "entries": entries}
@@ -804,23 +800,13 @@ class PosixMoveUnsupportedError(Exception):
 def _scandir_public(path):
     """Generate all directory entries, excluding hidden files.
     """
-    for entry in scandir.scandir(path):
-        if not entry.name.startswith("."):
-            yield entry
-
-
-def _scandir_files(path):
-    """Generate all files, descending into subdirs.
-    """
-    try:
-        for entry in scandir.scandir(path):
-            if entry.is_dir():
-                for subentry in _scandir_files(entry.path):
-                    yield subentry
-            else:
+    # closing_scandir releases the directory handle as soon as the listing
+    # (or the caller) finishes, rather than waiting for the iterator to be
+    # collected.
+    with utils.closing_scandir(path) as entries:
+        for entry in entries:
+            if not entry.name.startswith("."):
                 yield entry
-    except OSError:
-        raise StopIteration()
 
 
 def path2browse_dict(path):
@@ -828,35 +814,90 @@ def path2browse_dict(path):
     and properties.
     """
     should_count = not utils.get_setting("object_counting_disabled", False)
+    use_count_cache = should_count and utils.get_setting("object_count_cache", False)
 
     entries = []
     directories = []
     properties = {}
 
-    for entry in sorted(_scandir_public(path), key=lambda e: e.name.lower()):
+    # Bucket names in a single scandir pass, then sort just the name lists:
+    # sorting DirEntry objects up front would keep every entry object alive
+    # for the whole listing.
+    for entry in _scandir_public(path):
         entries.append(entry.name)
         if not entry.is_dir():
             properties[entry.name] = {"size": entry.stat().st_size}
-        elif os.access(entry.path, os.R_OK):
+        else:
+            # No os.access probe here: it costs a syscall per subdirectory,
+            # and an unreadable directory simply counts as empty below.
             directories.append(entry.name)
             if should_count:
                 properties[entry.name] = {
-                    "object count": count_objects_in_directory(entry.path)
+                    "object count": count_objects_in_directory(
+                        entry.path, use_cache=use_count_cache
+                    )
                 }
 
+    entries.sort(key=str.lower)
+    directories.sort(key=str.lower)
+
     return {"directories": directories, "entries": entries, "properties": properties}
 
 
-def count_objects_in_directory(path):
+# Object counts remembered by count_objects_in_directory, keyed by directory
+# path with the directory's mtime at count time. Cleared wholesale once it
+# grows past _OBJECT_COUNT_CACHE_MAX entries.
+_object_count_cache = {}
+_OBJECT_COUNT_CACHE_MAX = 4096
+
+
+def count_objects_in_directory(path, use_cache=False):
     """
     Returns all the files in a directory, including children.
+
+    When `use_cache` is True (the "object_count_cache" setting), counts are
+    remembered per directory and reused until the directory's mtime changes,
+    so repeat browses of a large space skip the recursive re-scan. Changes
+    deeper in the tree do not update a directory's own mtime, so cached
+    counts can lag behind; the cache is therefore opt-in.
     """
-    count = 0
-    for entry in _scandir_files(path):
-        count += 1
+    if not use_cache:
+        return _count_objects(path)
 
-        # Limit the number of files counted to keep it from being too slow
-        if count >= 5000:
-            return "5000+"
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return 0
+    cached = _object_count_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    count = _count_objects(path)
+    if len(_object_count_cache) >= _OBJECT_COUNT_CACHE_MAX:
+        _object_count_cache.clear()
+    _object_count_cache[path] = (mtime, count)
+    return count
+
+
+def _count_objects(path):
+    """Count the files under `path` with an iterative scandir walk,
+    descending into subdirs. Directories that cannot be read count as empty.
+    """
+    count = 0
+    stack = [path]
+    while stack:
+        try:
+            with utils.closing_scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    else:
+                        count += 1
+
+                        # Limit the number of files counted to keep it from
+                        # being too slow
+                        if count >= 5000:
+                            return "5000+"
+        except OSError:
+            continue
 
     return count
@@ -1,58 +1,145 @@
 from __future__ import absolute_import
 
-import json
+import contextlib
 import logging
 import sys
+import threading
 
 from django.dispatch import receiver, Signal
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.core.urlresolvers import reverse
 from django.db.models import signals
-from django.utils.translation import ugettext as _
+from django.utils.encoding import force_text
+from django.utils.lru_cache import lru_cache
+from django.utils.translation import ugettext_lazy
 from tastypie.models import create_api_key
 from prometheus_client import Counter
 
 LOGGER = logging.getLogger(__name__)
 
+# Evaluated once: _create_api_key runs on every User save, and whether we're
+# under pytest cannot change after startup.
+_IS_PYTEST = "pytest" in sys.modules
+
+# Notification templates, hoisted to module level as lazy translations so the
+# receivers only interpolate; resolution against the active language still
+# happens per message. The placeholders are kept %-style to match the
+# existing msgids in the translation catalogs.
+_DELETION_REQUEST_SUBJECT = ugettext_lazy("Deletion request for package %(uuid)s")
+_DELETION_REQUEST_BODY = ugettext_lazy(
+    """A package deletion request was received:
+
+Pipeline UUID: %(pipeline)s
+Package UUID: %(uuid)s
+Package location: %(location)s"""
+)
+_DELETION_REQUEST_URL = ugettext_lazy(
+    "To approve this deletion request, visit: %(url)s"
+)
+_FIXITY_FAILED_SUBJECT = ugettext_lazy("Fixity check failed for package %(uuid)s")
+_FIXITY_FAILED_BODY = ugettext_lazy(
+    """
+A fixity check failed for the package with UUID %(uuid)s. This package is currently stored at: %(location)s
+
+Full failure report (in JSON format):
+%(report)s
+"""
+)
+
 deletion_request = Signal(providing_args=["uuid", "location", "url", "pipeline"])
-failed_fixity_check = Signal(providing_args=["uuid", "location", "report"])
-successful_fixity_check = Signal(providing_args=["uuid", "location", "report"])
-fixity_check_not_run = Signal(providing_args=["uuid", "location", "report"])
+# ``report`` is the parsed report dict; ``report_json`` is the same report
+# pre-serialized by the sender, for receivers that embed it in an email.
+failed_fixity_check = Signal(
+    providing_args=["uuid", "location", "report", "report_json"]
+)
+successful_fixity_check = Signal(
+    providing_args=["uuid", "location", "report", "report_json"]
+)
+fixity_check_not_run = Signal(
+    providing_args=["uuid", "location", "report", "report_json"]
+)
+
+
+# Administrator email addresses, cached so that a bulk fixity run doesn't
+# repeat the same superuser query for every checked package. Invalidated
+# whenever a User row changes.
+_ADMIN_EMAILS_CACHE_KEY = "locations:admin_emails"
+_ADMIN_EMAILS_CACHE_SECONDS = 300
+
+
+def _get_admin_emails():
+    emails = cache.get(_ADMIN_EMAILS_CACHE_KEY)
+    if emails is None:
+        # Only the addresses are needed; skip hydrating full User rows.
+        emails = list(
+            User.objects.filter(is_superuser=True).values_list("email", flat=True)
+        )
+        cache.set(_ADMIN_EMAILS_CACHE_KEY, emails, _ADMIN_EMAILS_CACHE_SECONDS)
+    return emails
+
+
+def _invalidate_admin_emails(sender, **kwargs):
+    cache.delete(_ADMIN_EMAILS_CACHE_KEY)
+
+
+signals.post_save.connect(
+    _invalidate_admin_emails, sender=User, dispatch_uid="admin_emails_cache_save"
+)
+signals.post_delete.connect(
+    _invalidate_admin_emails, sender=User, dispatch_uid="admin_emails_cache_delete"
+)
+
+
+def _send_messages(messages):
+    try:
+        get_connection().send_messages(messages)
+    except Exception:
+        LOGGER.exception("Unable to send notification email to administrators")
 
 
 def _notify_administrators(subject, message):
-    admin_users = User.objects.filter(is_superuser=True)
-    for user in admin_users:
-        try:
-            user.email_user(subject, message)
-        except Exception:
-            LOGGER.exception("Unable to send email to %s", user.email)
+    emails = _get_admin_emails()
+    if not emails:
+        return
+    # The body is identical for every administrator, so BCC them all on one
+    # message: a single SMTP transaction however many admins there are, and
+    # recipients don't see each other's addresses.
+    messages = [EmailMessage(subject, message, bcc=emails)]
+    # Deliver from a background thread so the signal sender (typically an API
+    # request) isn't blocked on SMTP round trips; failures are only logged
+    # anyway, so nothing is lost by not waiting.
+    thread = threading.Thread(target=_send_messages, args=(messages,))
+    thread.daemon = True
+    thread.start()
+
+
+@lru_cache(maxsize=None)
+def _package_delete_request_path():
+    """Resolve the approval page path once per process.
+
+    Failed resolutions are not cached, so a URLconf that isn't loaded yet
+    doesn't poison the memo.
+    """
+    return reverse("package_delete_request")
 
 
 @receiver(deletion_request, dispatch_uid="deletion_request")
 def report_deletion_request(sender, **kwargs):
-    subject = _("Deletion request for package %(uuid)s") % {"uuid": kwargs["uuid"]}
-    message = (
-        _(
-            """A package deletion request was received:
-
-Pipeline UUID: %(pipeline)s
-Package UUID: %(uuid)s
-Package location: %(location)s"""
-        )
-        % {
-            "pipeline": kwargs["pipeline"],
-            "uuid": kwargs["uuid"],
-            "location": kwargs["location"],
-        }
-    )
+    subject = force_text(_DELETION_REQUEST_SUBJECT) % {"uuid": kwargs["uuid"]}
+    message = force_text(_DELETION_REQUEST_BODY) % {
+        "pipeline": kwargs["pipeline"],
+        "uuid": kwargs["uuid"],
+        "location": kwargs["location"],
+    }
 
     # The URL may not be configured in the site; if it isn't,
     # don't try to tell the user the URL to approve/deny the request.
     if kwargs["url"]:
-        message = message + _("To approve this deletion request, visit: %(url)s") % {
-            "url": kwargs["url"] + reverse("package_delete_request")
+        message = message + force_text(_DELETION_REQUEST_URL) % {
+            "url": kwargs["url"] + _package_delete_request_path()
         }
 
     _notify_administrators(subject, message)
@@ -63,47 +150,36 @@ def _log_report(uuid, success, message=None):
     # imported in models.__init__.py and seems to cause a circular import error
     from . import models
 
-    package = models.Package.objects.get(uuid=uuid)
+    # FixityLog.package points at Package.uuid, so the UUID from the signal
+    # can be assigned directly without fetching the package row first.
     models.FixityLog.objects.create(
-        package=package, success=success, error_details=message
+        package_id=uuid, success=success, error_details=message
     )
 
 
-@receiver(failed_fixity_check, dispatch_uid="fixity_check")
+@receiver(failed_fixity_check, dispatch_uid="failed_fixity_check")
 def report_failed_fixity_check(sender, **kwargs):
-    report_data = json.loads(kwargs["report"])
-    _log_report(kwargs["uuid"], False, report_data["message"])
+    _log_report(kwargs["uuid"], False, kwargs["report"]["message"])
 
-    subject = _("Fixity check failed for package %(uuid)s") % {"uuid": kwargs["uuid"]}
-    message = (
-        _(
-            """
-A fixity check failed for the package with UUID %(uuid)s. This package is currently stored at: %(location)s
-
-Full failure report (in JSON format):
-%(report)s
-"""
-        )
-        % {
-            "uuid": kwargs["uuid"],
-            "location": kwargs["location"],
-            "report": kwargs["report"],
-        }
-    )
+    subject = force_text(_FIXITY_FAILED_SUBJECT) % {"uuid": kwargs["uuid"]}
+    message = force_text(_FIXITY_FAILED_BODY) % {
+        "uuid": kwargs["uuid"],
+        "location": kwargs["location"],
+        "report": kwargs["report_json"],
+    }
 
     _notify_administrators(subject, message)
 
 
-@receiver(successful_fixity_check, dispatch_uid="fixity_check")
+@receiver(successful_fixity_check, dispatch_uid="successful_fixity_check")
 def report_successful_fixity_check(sender, **kwargs):
     _log_report(kwargs["uuid"], True)
 
 
-@receiver(fixity_check_not_run, dispatch_uid="fixity_check")
+@receiver(fixity_check_not_run, dispatch_uid="fixity_check_not_run")
 def report_not_run_fixity_check(sender, **kwargs):
     """Handle a fixity not run signal."""
-    report_data = json.loads(kwargs["report"])
-    _log_report(uuid=kwargs["uuid"], success=None, message=report_data["message"])
+    _log_report(uuid=kwargs["uuid"], success=None, message=kwargs["report"]["message"])
 
 
 def _create_api_key(sender, *args, **kwargs):
@@ -113,7 +189,7 @@ def _create_api_key(sender, *args, **kwargs):
     custom key. Tell me there is a better way to do this that does not require
     more scattering of signal business.
     """
-    if "pytest" in sys.modules:
+    if _IS_PYTEST:
         return
     create_api_key(sender, **kwargs)
 
@@ -135,10 +211,54 @@ if settings.PROMETHEUS_ENABLED:
         "django_model_delete_total", "Total model delete calls", ["model"]
     )
 
-    @receiver(signals.post_save)
-    def increment_model_save_count(sender, **kwargs):
-        model_save_count.labels(model=sender.__name__).inc()
+    # ``labels()`` rebuilds the label tuple and looks up the child metric on
+    # every call; these receivers fire for every ORM write in the project, so
+    # remember the child per model class. Model classes live for the whole
+    # process, so a plain dict is fine as the cache.
+    _save_counters = {}
+    _delete_counters = {}
 
-    @receiver(signals.post_delete)
+    @receiver(signals.post_save, dispatch_uid="prometheus_model_save_count")
+    def increment_model_save_count(sender, **kwargs):
+        counter = _save_counters.get(sender)
+        if counter is None:
+            counter = _save_counters.setdefault(
+                sender, model_save_count.labels(model=sender.__name__)
+            )
+        counter.inc()
+
+    @receiver(signals.post_delete, dispatch_uid="prometheus_model_delete_count")
     def increment_model_delete_count(sender, **kwargs):
-        model_delete_count.labels(model=sender.__name__).inc()
+        counter = _delete_counters.get(sender)
+        if counter is None:
+            counter = _delete_counters.setdefault(
+                sender, model_delete_count.labels(model=sender.__name__)
+            )
+        counter.inc()
+
+
+@contextlib.contextmanager
+def signals_paused():
+    """Temporarily disconnect the per-save bookkeeping receivers.
+
+    Bulk operations (data migrations, fixture loads, batch user imports) pay
+    for API-key creation and Prometheus counting on every row; wrap them in
+    this to skip that work. The receivers are reconnected on exit even if the
+    wrapped block raises.
+    """
+    signals.post_save.disconnect(_create_api_key, sender=User)
+    if settings.PROMETHEUS_ENABLED:
+        signals.post_save.disconnect(dispatch_uid="prometheus_model_save_count")
+        signals.post_delete.disconnect(dispatch_uid="prometheus_model_delete_count")
+    try:
+        yield
+    finally:
+        signals.post_save.connect(_create_api_key, sender=User)
+        if settings.PROMETHEUS_ENABLED:
+            signals.post_save.connect(
+                increment_model_save_count, dispatch_uid="prometheus_model_save_count"
+            )
+            signals.post_delete.connect(
+                increment_model_delete_count,
+                dispatch_uid="prometheus_model_delete_count",
+            )
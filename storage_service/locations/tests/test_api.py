@@ -7,11 +7,15 @@ import shutil
 import vcr
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import RequestFactory, TestCase
 from django.utils.six.moves.urllib.parse import urlparse
 
 from locations import models
-from locations.api.sword.views import _parse_name_and_content_urls_from_mets_file
+from locations.api.sword.helpers import parse_filename_from_content_disposition
+from locations.api.sword.views import (
+    _parse_name_and_content_urls_from_mets_file,
+    deposit_media,
+)
 from . import TempDirMixin
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -566,7 +570,55 @@ class TestPackageAPI(TempDirMixin, TestCase):
         )
 
 
-class TestSwordAPI(TestCase):
+class FakeDeposit(object):
+    """Stands in for a deposit Package backed by a directory on disk."""
+
+    def __init__(self, path):
+        self.full_path = path
+
+    def has_been_submitted_for_processing(self):
+        return False
+
+
+class TestSwordAPI(TempDirMixin, TestCase):
+    def test_deposit_media_get_lists_deposit_files_as_json(self):
+        """It should return a JSON array naming exactly the deposit's regular
+        files, omitting subdirectories.
+        """
+        for name in ("b.txt", "a.txt"):
+            with open(os.path.join(str(self.tmpdir), name), "w") as f:
+                f.write("contents")
+        os.mkdir(os.path.join(str(self.tmpdir), "subdir"))
+
+        request = RequestFactory().get("/")
+        response = deposit_media(request, FakeDeposit(str(self.tmpdir)))
+
+        assert response["Content-Type"] == "application/json"
+        file_list = json.loads(b"".join(response.streaming_content).decode("utf8"))
+        assert sorted(file_list) == ["a.txt", "b.txt"]
+
+    def test_parse_filename_from_content_disposition(self):
+        """It should extract plain, quoted and RFC 2231-encoded filenames, and
+        return an empty string when the header carries none.
+        """
+        assert (
+            parse_filename_from_content_disposition("attachment; filename=joke.jpg")
+            == "joke.jpg"
+        )
+        assert (
+            parse_filename_from_content_disposition(
+                'attachment; filename="space file.jpg"'
+            )
+            == "space file.jpg"
+        )
+        assert (
+            parse_filename_from_content_disposition(
+                "attachment; filename*=UTF-8''na%C3%AFve%20file.txt"
+            )
+            == "na\u00efve file.txt"
+        )
+        assert parse_filename_from_content_disposition("attachment") == ""
+
     def test_removes_forward_slash_parse_fedora_mets(self):
         """ It should remove forward slashes in the deposit name and all
         filenames extracted from a Fedora METS file.
@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+import pytest
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import signals as model_signals
+
+from locations import signals
+
+
+@pytest.fixture
+def api_key_receiver(mocker):
+    """Make _create_api_key observable.
+
+    Disables the pytest short-circuit inside the receiver and stubs the
+    tastypie hook it delegates to, so tests can count invocations.
+    """
+    mocker.patch.object(signals, "_IS_PYTEST", False)
+    return mocker.patch.object(signals, "create_api_key")
+
+
+def _save_user():
+    model_signals.post_save.send(sender=User, instance=None, created=True)
+
+
+def test_signals_paused_suspends_api_key_creation(api_key_receiver):
+    with signals.signals_paused():
+        _save_user()
+    api_key_receiver.assert_not_called()
+
+
+def test_signals_paused_reconnects_on_exit(api_key_receiver):
+    with signals.signals_paused():
+        pass
+    _save_user()
+    assert api_key_receiver.call_count == 1
+
+
+def test_signals_paused_reconnects_after_exception(api_key_receiver):
+    with pytest.raises(ValueError):
+        with signals.signals_paused():
+            raise ValueError("boom")
+    _save_user()
+    assert api_key_receiver.call_count == 1
+
+
+@pytest.mark.skipif(
+    not settings.PROMETHEUS_ENABLED, reason="Prometheus support is not enabled"
+)
+def test_signals_paused_suspends_prometheus_counters():
+    counter = signals.model_save_count.labels(model=User.__name__)
+    before = counter._value.get()
+    with signals.signals_paused():
+        _save_user()
+    assert counter._value.get() == before
+    _save_user()
+    assert counter._value.get() == before + 1
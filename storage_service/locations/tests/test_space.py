@@ -1,8 +1,11 @@
 from __future__ import absolute_import
+import os
+
 import pytest
 from scandir import scandir
 
-from locations.models.space import path2browse_dict
+from locations.models import space
+from locations.models.space import count_objects_in_directory, path2browse_dict
 
 
 def _restrict_access_to(restricted_path):
@@ -130,3 +133,52 @@ def test_path2browse_dict_object_counting_ignores_read_protected_directories(
             "tree_a.txt": {"size": 6},
         },
     }
+
+
+def test_count_objects_cache_reuses_unchanged_directory(tree, mocker):
+    space._object_count_cache.clear()
+    first = str(tree.join("first"))
+    assert count_objects_in_directory(first, use_cache=True) == 2
+
+    # While the directory's mtime is unchanged, the count must be served from
+    # the cache without re-scanning.
+    scandir_mock = mocker.patch("scandir.scandir")
+    assert count_objects_in_directory(first, use_cache=True) == 2
+    scandir_mock.assert_not_called()
+
+
+def test_count_objects_cache_recounts_when_directory_changes(tree):
+    space._object_count_cache.clear()
+    first = tree.join("first")
+    assert count_objects_in_directory(str(first), use_cache=True) == 2
+
+    first.join("first_c.txt").write("first C")
+    # Push the directory's mtime forward explicitly so the invalidation isn't
+    # at the mercy of the filesystem's timestamp granularity.
+    mtime = os.stat(str(first)).st_mtime + 10
+    os.utime(str(first), (mtime, mtime))
+    assert count_objects_in_directory(str(first), use_cache=True) == 3
+
+
+def test_count_objects_cache_keeps_5000_cap(tree, mocker):
+    space._object_count_cache.clear()
+    first = str(tree.join("first"))
+    count_mock = mocker.patch(
+        "locations.models.space._count_objects", return_value="5000+"
+    )
+    assert count_objects_in_directory(first, use_cache=True) == "5000+"
+    # The "5000+" sentinel must survive a cached round trip, without the
+    # directory being walked again.
+    assert count_objects_in_directory(first, use_cache=True) == "5000+"
+    assert count_mock.call_count == 1
+
+
+def test_path2browse_dict_ignores_count_cache_by_default(tree, mocker):
+    # Object counting enabled, count cache off (both settings read False).
+    mocker.patch("common.utils.get_setting", return_value=False)
+    space._object_count_cache.clear()
+    first = str(tree.join("first"))
+    # Poison the cache: with the setting off, browsing must not see it.
+    space._object_count_cache[first] = (os.stat(first).st_mtime, 99)
+    result = path2browse_dict(str(tree))
+    assert result["properties"]["first"] == {"object count": 2}